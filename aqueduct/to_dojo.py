@@ -1,9 +1,20 @@
 import pandas as pd
 from tqdm import tqdm
 import geopandas as gpd
+import pyogrio
 import shapely
 import numpy as np
 import os
+import sys
+import argparse
+import hashlib
+import json
+from glob import glob
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from dojo_output import add_output_arguments, check_output_arguments, FrameWriter, PartitionedWriter
+from parallel import ordered_map
 
 import pdb
 
@@ -79,72 +90,293 @@ class Scenario:
 import warnings
 warnings.filterwarnings("ignore", category=UserWarning)
 
-def convert_shape(shp, cell_size=0.1):
-    """adapted from https://github.com/jataware/convert-shp-to-csv/blob/main/convert_shp_to_csv/main.py"""
+#cells of every grid are aligned to a global lattice starting at this (lon, lat), so tiles and runs line up
+grid_origin = (-180.0, -90.0)
 
-    # Pull list of data columns we want to include in the output
-    # Basically, anything that is not the `geometry`
-    # TODO: Allow specification of desired columns via cli arguments?
-    columns = [col for col in shp.columns if col != "geometry"]
+def convert_shape(shp, cell_size=0.1, tile_cells=100, workers=1, keep=None, cache_dir=None):
+    """
+    adapted from https://github.com/jataware/convert-shp-to-csv/blob/main/convert_shp_to_csv/main.py
 
-    # Determine geometric values
-    cell_width = cell_size
-    cell_height = cell_size
-    xmin, ymin, xmax, ymax = shp.total_bounds
+    the grid is processed in square tiles of tile_cells x tile_cells cells, skipping tiles that no shape touches
+    yields a dataframe of cells (latitude, longitude, basin) for each non-empty tile, so the full grid never has
+    to be in memory at once. basin is the position in shp of the shape containing the cell's center, so cells
+    only carry an index into the shape attributes instead of a copy of them (see join_basins)
+
+    workers: number of processes used to locate the grid cells of each tile in the shapes
+    keep: optional boolean mask over shp. Only tiles touching the kept shapes are gridded, and only cells in them are yielded.
+          Cells are still located against every shape, so the cached tiles don't depend on the mask
+    cache_dir: folder to cache the located cells of each tile in. Must be specific to shp and cell_size
+    """
+
+    tiles = grid_tiles(shp if keep is None else shp[keep], cell_size, tile_cells)
+
+    for x, y, basins in tqdm(locate_tiles(shp, cell_size, tiles, workers, cache_dir), total=len(tiles), desc='Converting grid tiles'):
+        if keep is not None:
+            kept = keep[basins]
+            x, y, basins = x[kept], y[kept], basins[kept]
+        if len(basins) == 0:
+            continue
+
+        yield pd.DataFrame({
+            "latitude": y,
+            "longitude": x,
+            "basin": basins,
+        })
+
+
+
+def convert_shape_sizes(shp, cell_sizes, tile_cells=100, workers=1, keep=None, cache_dirs=None):
+    """
+    grid the shapes at several cell sizes in one pass (see convert_shape), yielding (cell_size, cells) for each tile
+
+    the finest grid is located once, and every cell size that is an odd multiple of it is derived from its cells (see coarsen_cells)
+    other cell sizes are gridded separately, reusing the spatial index of shp
+    cache_dirs: optional map from cell size to the folder to cache its located tiles in
+    """
+
+    cache_dirs = cache_dirs or {}
+    finest = min(cell_sizes)
+    derived, separate = {}, []
+    for cell_size in sorted(set(cell_sizes) - {finest}):
+        ratio = round(cell_size / finest)
+        if ratio % 2 == 1 and abs(cell_size / finest - ratio) < 1e-9:
+            derived[cell_size] = ratio
+        else:
+            separate.append(cell_size)
+
+    for cells in convert_shape(shp, finest, tile_cells, workers, keep, cache_dirs.get(finest)):
+        #derive the coarse cells before handing out the fine ones, which the caller may modify
+        coarse = {cell_size: coarsen_cells(cells, finest, cell_size, ratio) for cell_size, ratio in derived.items()}
+
+        yield finest, cells
+        for cell_size, coarse_cells in coarse.items():
+            if len(coarse_cells) > 0:
+                yield cell_size, coarse_cells
 
-    # Build list of boxes representing the grid that covers the full shape image rectangle
-    grid_cells = []
-    for x0 in tqdm(np.arange(xmin, xmax + cell_width, cell_width), desc='Building grid'):
-        for y0 in np.arange(ymin, ymax + cell_height, cell_height):
-            x1 = x0 - cell_width
-            y1 = y0 + cell_height
-            new_cell = shapely.geometry.box(x0, y0, x1, y1)
-            grid_cells.append(new_cell)
-
-    # Create a GeoDataFrame based on the grid cells, setting a value that represents the center of the cell
-    gridded = gpd.GeoDataFrame(geometry=grid_cells)
-    gridded["centroid"] = gridded.geometry.apply(lambda x: x.centroid)
-
-    gridded.set_crs(shp.crs, inplace=True)
-
-    # Join the shape file with the grid by overlaying the shape over the grid and then removing cells whose centers
-    # are outside the defined shape(s).
-    # This is pretty slow btw, TBD if there's a faster method
-    print('Joining shape file with grid...', end='', flush=True)
-    gdf = gpd.sjoin(
-        gridded,
-        shp,
+    for cell_size in separate:
+        for cells in convert_shape(shp, cell_size, tile_cells, workers, keep, cache_dirs.get(cell_size)):
+            yield cell_size, cells
+
+
+def coarsen_cells(cells, cell_size, coarse_size, ratio):
+    """
+    derive the cells of a coarser grid from the located cells of a finer one, where coarse_size = cell_size * ratio for an odd ratio
+
+    on the global lattice the center of coarse cell I is exactly the center of fine cell I*ratio + ratio//2,
+    so the coarse cells are the fine cells at those indices, in the same basins
+    """
+
+    ox, oy = grid_origin
+    i = np.round((cells['longitude'].to_numpy() - ox) / cell_size - 0.5).astype(int)
+    j = np.round((cells['latitude'].to_numpy() - oy) / cell_size - 0.5).astype(int)
+    centers = (i % ratio == ratio // 2) & (j % ratio == ratio // 2)
+
+    return pd.DataFrame({
+        "latitude": np.round(oy + (j[centers] // ratio + 0.5) * coarse_size, 10),
+        "longitude": np.round(ox + (i[centers] // ratio + 0.5) * coarse_size, 10),
+        "basin": cells['basin'].to_numpy()[centers],
+    })
+
+
+def grid_tiles(shp, cell_size, tile_cells):
+    """
+    split the grid cells covering the bounds of shp into tiles of tile_cells x tile_cells cells
+    tiles are aligned to multiples of tile_cells on the global lattice, so the same tile always covers the same cells
+    returns a list of (i0, i1, j0, j1) lattice index ranges, for the tiles that touch the bounding box of at least one shape
+    """
+
+    # Lattice indices of the tiles that cover the full shape image rectangle
+    xmin, ymin, xmax, ymax = shp.total_bounds
+    ox, oy = grid_origin
+    i_start, i_stop = int(np.floor((xmin - ox) / cell_size)), int(np.ceil((xmax - ox) / cell_size))
+    j_start, j_stop = int(np.floor((ymin - oy) / cell_size)), int(np.ceil((ymax - oy) / cell_size))
+
+    tiles = []
+    for i0 in range(i_start - i_start % tile_cells, i_stop, tile_cells):
+        for j0 in range(j_start - j_start % tile_cells, j_stop, tile_cells):
+            tiles.append((i0, i0 + tile_cells, j0, j0 + tile_cells))
+
+    # Skip tiles that no shape touches (e.g. ocean), using the shapes' spatial index
+    boxes = shapely.box(
+        [ox + i0 * cell_size for i0, i1, j0, j1 in tiles],
+        [oy + j0 * cell_size for i0, i1, j0, j1 in tiles],
+        [ox + i1 * cell_size for i0, i1, j0, j1 in tiles],
+        [oy + j1 * cell_size for i0, i1, j0, j1 in tiles],
     )
+    touched = np.unique(shp.sindex.query(boxes)[0])
+
+    return [tiles[t] for t in touched]
+
+
+def locate_tiles(shp, cell_size, tiles, workers=1, cache_dir=None):
+    """
+    locate the cells of each tile (see locate_tile), in order
+    tiles found in cache_dir are loaded, the rest are computed (across a process pool if workers > 1) and saved there
+    """
+
+    paths = {tile: os.path.join(cache_dir, 'tile_{}_{}_{}_{}.npz'.format(*tile)) for tile in tiles} if cache_dir is not None else {}
+    missing = [tile for tile in tiles if tile not in paths or not os.path.exists(paths[tile])]
+
+    if workers > 1 and len(missing) > 0:
+        #workers only need the geometry, not the attribute table, and at most 2 tiles per worker are computed
+        #ahead of the consumer, so finished tiles don't pile up in memory
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(shp[['geometry']], cell_size))
+        computed = ordered_map(executor, _locate_tile, missing, ahead=2 * workers)
+    else:
+        executor = None
+        computed = (locate_tile(shp, cell_size, tile) for tile in missing)
+
+    try:
+        missing = set(missing)
+        for tile in tiles:
+            if tile not in missing:
+                with np.load(paths[tile]) as cached:
+                    yield cached['x'], cached['y'], cached['basins']
+                continue
+
+            x, y, basins = next(computed)
+            if tile in paths:
+                write_cache(paths[tile], lambda tmp_path: np.savez(tmp_path, x=x, y=y, basins=basins))
+            yield x, y, basins
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+
+def locate_tile(shp, cell_size, tile):
+    """
+    find the basin containing the center of each cell in a tile
+    returns arrays of the x and y of the located cell centers (x outer, y inner), and the position of their basins in shp
+    """
+
+    i0, i1, j0, j1 = tile
+    ox, oy = grid_origin
+    i, j = np.meshgrid(np.arange(i0, i1), np.arange(j0, j1), indexing='ij')
+    x = np.round(ox + (i.ravel() + 0.5) * cell_size, 10)
+    y = np.round(oy + (j.ravel() + 0.5) * cell_size, 10)
+
+    cells, basins = locate_points(shp, x, y)
+
+    return x[cells], y[cells], basins
+
+
+#state for worker processes, set once per process by _init_worker
+_worker = {}
+
+def _init_worker(shp, cell_size):
+    _worker['shp'] = shp
+    _worker['cell_size'] = cell_size
+
+def _locate_tile(tile):
+    return locate_tile(_worker['shp'], _worker['cell_size'], tile)
+
+
+
+def locate_points(shp, x, y):
+    """
+    find the shape that contains each point, using the spatial index of shp
+    points outside every shape are dropped, and points in several shapes (e.g. on a shared border) go to the first one
+
+    returns (points, shapes): positions of the located points, and the position in shp of the shape containing each one
+    """
+
+    points = shapely.points(x, y)
+    points_idx, shapes_idx = shp.sindex.query(points, predicate='intersects')
+
+    # keep the first (lowest position) shape for each point
+    order = np.lexsort((shapes_idx, points_idx))
+    points_idx, shapes_idx = points_idx[order], shapes_idx[order]
+    points_idx, first = np.unique(points_idx, return_index=True)
+
+    return points_idx, shapes_idx[first]
+
+
+
+
+def file_hash(path):
+    """sha256 of a shape file, including its sidecar files (.shx, .dbf, .prj, ...)"""
+
+    sha = hashlib.sha256()
+    stem = os.path.splitext(path)[0]
+    for filename in sorted(glob(stem + '.*')):
+        sha.update(os.path.basename(filename).encode())
+        with open(filename, 'rb') as f:
+            while chunk := f.read(1<<20):
+                sha.update(chunk)
+    return sha.hexdigest()
+
+
+def cache_key(*parts):
+    """short key for a cached artifact, from input file hashes and parameters"""
+    return hashlib.sha256(json.dumps(parts).encode()).hexdigest()[:16]
+
+
+def write_cache(path, write):
+    """
+    write a cache file through a temporary file in the same directory, then move it into place,
+    so a run killed mid-write never leaves a truncated file at path for later runs to trust
+
+    write: function that writes the file to the path it is given
+    """
+
+    stem, ext = os.path.splitext(path)
+    tmp_path = f'{stem}.tmp{os.getpid()}{ext}' #keep the extension, np.savez adds .npz otherwise
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def basin_continents(shape, continents_path, cache_path=None):
+    """
+    spatially join the basins with the continents, to figure out which continent(s) each basin is in
+    returns a dataframe of (basin, CONTINENT) pairs, where basin is a position in shape
+
+    cache_path: parquet file to cache the pairs in
+    """
+
+    if cache_path is not None and os.path.exists(cache_path):
+        return pd.read_parquet(cache_path)
+
+    continents = read_shape(continents_path, columns=['CONTINENT'])
+    print('Joining continents to shape file...', end='', flush=True)
+    joined = gpd.sjoin(shape.reset_index(drop=True), continents)
     print('done')
 
-    rows = []
-    for row in tqdm(gdf.iterrows(), total=len(gdf), desc='Converting grid to lat/lon'):
-        rows.append({
-            "latitude": row[1].centroid.y,
-            "longitude": row[1].centroid.x,
-            **{col: row[1][col] for col in columns},
-        })
+    pairs = pd.DataFrame({'basin': joined.index.to_numpy(), 'CONTINENT': joined['CONTINENT'].to_numpy()})
+    pairs = pairs.sort_values('basin', kind='stable').reset_index(drop=True)
 
-    # Convert the list of rows to a dataframe
-    df = pd.DataFrame(rows)
+    if cache_path is not None:
+        write_cache(cache_path, lambda tmp_path: pairs.to_parquet(tmp_path, index=False))
 
-    return df
+    return pairs
 
 
 
+def join_basins(cells, basin_years):
+    """
+    combine gridded cells with the per-year basin attributes, i.e. the output of extract_years on the shape attributes
+    cells carry the position of their basin, so each cell's rows are gathered by integer index
+    """
 
-def extract_years(df):
-    columns_to_keep = {
-        'latitude':'latitude', 
-        'longitude':'longitude',
-        'BasinID':'id',
-        'dwnBasinID': 'subid',
-        'CONTINENT':'continent',
-    }
-    
-    #collect columns that will be part of the output
-    cols = []
-    for col in df.columns:
+    num_years = len(year_codes)
+    rows = (cells['basin'].to_numpy()[:, None] * num_years + np.arange(num_years)).ravel()
+
+    out = basin_years.take(rows).reset_index(drop=True)
+    out.insert(0, 'longitude', np.repeat(cells['longitude'].to_numpy(), num_years))
+    out.insert(0, 'latitude', np.repeat(cells['latitude'].to_numpy(), num_years))
+
+    return out
+
+
+
+def value_scenarios(columns):
+    """decode the columns holding scenario values into Scenarios (labels and uncertainty values are skipped)"""
+
+    scenarios = []
+    for col in columns:
         try:
             s = Scenario(col)
         except ValueError:
@@ -156,22 +388,72 @@ def extract_years(df):
         if s.T == 'u': #don't want uncertainty values
             continue
         
-        cols.append(s)
+        scenarios.append(s)
 
-    #generate the new output dataframe
-    rows = []
-    for row in tqdm(df.iterrows(), total=len(df), desc='Processing rows'):
-        #keep specified values that are constant across years, e.g. id, lat, lon, etc.
-        to_keep = {columns_to_keep[k]: v for k, v in row[1].items() if k in columns_to_keep}
-        
-        #create a row for each year
-        for year in year_codes:
-            scenarios = [s for s in cols if s.YY == year]
-            out_row = {**to_keep, "year":year_codes[year]}
-            for s in scenarios:
-                out_row[s.label] = row[1][s.raw]
-            rows.append(out_row)
-    out = pd.DataFrame(rows)
+    return scenarios
+
+
+
+#attribute columns that are constant across years, and their names in the output
+columns_to_keep = {
+    'latitude':'latitude', 
+    'longitude':'longitude',
+    'BasinID':'id',
+    'dwnBasinID': 'subid',
+    'CONTINENT':'continent',
+}
+
+
+def used_columns(path):
+    """attribute columns of a shape file that extract_years uses, read from its schema without loading any rows"""
+
+    fields = pyogrio.read_info(path)['fields']
+    return [col for col in fields if col in columns_to_keep] + [s.raw for s in value_scenarios(fields)]
+
+
+def read_shape(path, columns=None, cache_path=None):
+    """
+    read a shape file with only the given attribute columns (plus geometry), through pyogrio's arrow reader
+
+    cache_path: GeoParquet file to cache the selected columns in. Later runs read it instead of the shape file
+    """
+
+    if cache_path is not None and os.path.exists(cache_path):
+        return gpd.read_parquet(cache_path)
+
+    print(f'Reading {os.path.basename(path)}...', end='', flush=True)
+    shape = gpd.read_file(path, engine='pyogrio', use_arrow=True, columns=columns)
+    print('done')
+
+    if cache_path is not None:
+        write_cache(cache_path, lambda tmp_path: shape.to_parquet(tmp_path, index=False))
+
+    return shape
+
+
+
+def extract_years(df):
+    #collect columns that will be part of the output, decoded once into (year, label)
+    cols = value_scenarios(df.columns)
+    values = df[[s.raw for s in cols]]
+    values.columns = pd.MultiIndex.from_arrays(
+        [[year_codes[s.YY] for s in cols], [s.label for s in cols]],
+        names=['year', 'label'],
+    )
+
+    #lay out the values as (year, label) for every year, then stack so each row of df becomes one row per year
+    years = list(year_codes.values())
+    labels = list(dict.fromkeys(values.columns.get_level_values('label')))
+    values = values.reindex(columns=pd.MultiIndex.from_product([years, labels]))
+    values = values.to_numpy().reshape(len(df) * len(years), len(labels))
+
+    #keep specified values that are constant across years, e.g. id, lat, lon, etc.
+    out = pd.DataFrame({
+        columns_to_keep[col]: np.repeat(df[col].to_numpy(), len(years))
+        for col in df.columns if col in columns_to_keep
+    })
+    out['year'] = np.tile(years, len(df))
+    out = pd.concat([out, pd.DataFrame(values, columns=labels)], axis=1)
 
     return out
 
@@ -182,6 +464,11 @@ def extract_years(df):
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert Aqueduct future projections to a gridded dataset for Dojo')
+    parser.add_argument('--workers', type=int, default=1, help='number of processes used to grid the shape file (default: 1)')
+    add_output_arguments(parser)
+    args = parser.parse_args()
+    check_output_arguments(parser, args)
 
     #paths
     continents_path = 'World_Continents/World_Continents.shp'
@@ -192,61 +479,84 @@ if __name__ == '__main__':
         os.makedirs(out_dir)
 
     #settings
-    cell_size=0.1
+    cell_sizes = [0.1] #e.g. [0.5, 0.25, 0.1] to grid several resolutions in one run
+
+    #folder for cached spatial join artifacts, reused between runs (set to None to skip caching)
+    cache_dir = 'cache'
 
-    #split data files by unique values in these columns (set to None to skip splitting)
-    splits = ['continent']#, 'year']
+    #split data files by unique values in these columns, into one partitioned dataset per layout (set to None to skip splitting)
+    splits = [['continent']]#, ['continent', 'year']]
 
     #continent filter (set to None to skip filtering)
     continents_to_keep = {'Africa'}#, 'Asia', 'Europe', 'North America', 'South America', 'Oceania'}
 
 
+    #only the attribute columns that end up in the output are read from the shape file
+    columns = used_columns(shape_path)
+
+    #cached artifacts are keyed on the hashes of the input files and the parameters they depend on
+    shape_cache, continents_cache, grid_cache = None, None, None
+    if cache_dir is not None:
+        shape_hash = file_hash(shape_path)
+        shape_cache = os.path.join(cache_dir, f'shape_{cache_key(shape_hash, columns)}.parquet')
+        continents_cache = os.path.join(cache_dir, f'continents_{cache_key(shape_hash, file_hash(continents_path))}.parquet')
+        grid_cache = {cell_size: os.path.join(cache_dir, f'grid_{cache_key(shape_hash, cell_size, grid_origin)}') for cell_size in cell_sizes}
+        for path in grid_cache.values():
+            if not os.path.exists(path):
+                os.makedirs(path)
+
     # Convert a shape file to a geodataframe (this includes the dataset data)
-    shape = gpd.read_file(shape_path)
-    original_columns = shape.columns
-    new_columns_to_keep = ['CONTINENT']
-    keep_fn = lambda x: x in new_columns_to_keep or x in original_columns
+    shape = read_shape(shape_path, columns, shape_cache)
 
     #spatially join shape with continents to figure out which continent each basin is in
-    #then remove the extra columns that were added by the join
-    continents = gpd.read_file(continents_path)
-    print('Joining continents to shape file...', end='', flush=True)
-    shape = gpd.sjoin(shape, continents)
-    shape.drop(columns=[col for col in shape.columns if not keep_fn(col)], inplace=True)
-    print('done')
+    pairs = basin_continents(shape, continents_path, continents_cache)
 
     #optional filter for a specific continent
     if continents_to_keep is not None:
-        shape = shape[shape['CONTINENT'].isin(continents_to_keep)]
-
-
-    #convert the shapefile to a gridded dataframe
-    shape_frame = convert_shape(shape, cell_size=cell_size)
-
-    #run the process of extracting years from column names + renaming columns
-    out = extract_years(shape_frame)
-
-    #save the results    
-    if splits is not None:
-        #split the dataframe into multiple files according to the given columns
-        out_dir = os.path.join(out_dir, 'by ' + ', '.join(splits))
-        if not os.path.exists(out_dir):
-            os.makedirs(out_dir)
-        frames = [] #list of (name, dataframe) tuples
-        for name, group in out.groupby(splits):
-
-            if isinstance(name, tuple):
-                name = '_'.join([str(n) for n in name])
-            
-            #write the dataframes to csv
-            group.to_csv(os.path.join(out_dir, f'{name}.csv'), index=False)
-
-            #print the name and number of rows
-            print(f'saved {name}.csv: {len(group)} rows')
-
-    else:
-        #write a single csv
-        out.to_csv(os.path.join(out_dir, 'out.csv'), index=False)
-        print(f'saved out.csv: {len(out)} rows')
-
-
+        pairs = pairs[pairs['CONTINENT'].isin(continents_to_keep)].reset_index(drop=True)
+
+    #basin attributes with one row per (basin, continent) pair, like a spatial join of the two shape files
+    basins = shape.drop(columns='geometry').iloc[pairs['basin']].reset_index(drop=True)
+    basins['CONTINENT'] = pairs['CONTINENT']
+
+    #each grid cell uses the first kept row of its basin (-1 if the basin was filtered out)
+    basin_rows = np.full(len(shape), -1)
+    first = ~pairs['basin'].duplicated()
+    basin_rows[pairs['basin'][first]] = np.flatnonzero(first)
+    keep = basin_rows >= 0
+
+
+    #convert the shapefile to gridded dataframes tile by tile, streaming the results to the output files of each cell size
+    writers = {} #map from cell size to its output writers
+    for cell_size in cell_sizes:
+        size_dir = os.path.join(out_dir, f'{cell_size} deg')
+        if splits is not None:
+            #Hive-style partitioned datasets (e.g. by continent/continent=Africa/data.csv), all written in the same pass
+            writers[cell_size] = [
+                PartitionedWriter(os.path.join(size_dir, 'by ' + ', '.join(cols)), cols, args.format, args.compression, categorical=['continent'])
+                for cols in splits
+            ]
+        else:
+            if not os.path.exists(size_dir):
+                os.makedirs(size_dir)
+            writers[cell_size] = [FrameWriter(os.path.join(size_dir, 'out'), args.format, args.compression, categorical=['continent'])]
+
+    #run the process of extracting years from column names + renaming columns once per basin,
+    #then join the basin rows onto the cells of each tile
+    basin_years = extract_years(basins)
+
+    for cell_size, cells in convert_shape_sizes(shape, cell_sizes, workers=args.workers, keep=keep, cache_dirs=grid_cache):
+        cells['basin'] = basin_rows[cells['basin']]
+        out = join_basins(cells, basin_years)
+
+        #append the tile to every output of its cell size
+        for writer in writers[cell_size]:
+            writer.write(out)
+
+    for writer in [writer for size_writers in writers.values() for writer in size_writers]:
+        writer.close()
+
+        #print the name and number of rows of each file
+        files = writer.writers.values() if isinstance(writer, PartitionedWriter) else [writer]
+        for file in files:
+            print(f'saved {os.path.relpath(file.path, out_dir)}: {file.rows} rows')
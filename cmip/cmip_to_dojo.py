@@ -1,59 +1,196 @@
 import netCDF4
 from glob import glob
+import numpy as np
+import pandas as pd
 import xarray as xr
 from matplotlib import pyplot as plt
 from datetime import date, timedelta
 import json
 import logging
 import os
+import re
+import sys
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from dojo_output import add_output_arguments, check_output_arguments, FrameWriter
+from parallel import ordered_map
 
 import pdb
 
 
 
 
+def flatten_variable(ds, var):
+    """
+    flatten a data variable into a dataframe with one column per dimension (e.g. year, lat, lon) and one for its values
+
+    only var is read from the dataset, so bounds variables (lat_bnds, ...) and their nv dimension never enter the
+    frame, and every column is built straight from the coordinate and value arrays without a multiindex
+    """
+
+    da = ds[var]
+    shape = da.shape
+
+    columns = {}
+    for axis, dim in enumerate(da.dims):
+        coord = da[dim].to_numpy() if dim in da.coords else np.arange(shape[axis])
+        inner = int(np.prod(shape[axis + 1:]))
+        outer = int(np.prod(shape[:axis]))
+        columns[dim] = np.tile(np.repeat(coord, inner), outer)
+    columns[var] = da.to_numpy().ravel()
+
+    return pd.DataFrame(columns)
+
+
+
+#World Bank CMIP6 file names, e.g.
+#climatology-tas-annual-mean_cmip6_annual_all-regridded-bct-ssp245-climatology_median_2020-2039.nc
+#timeseries-tas-annual-mean_cmip6_annual_all-regridded-bct-ssp245-timeseries_median_2015-2100.nc
+filename_pattern = re.compile(
+    r'^(?P<product>[a-z]+)-(?P<variable>[a-z0-9]+)-(?P<aggregation>[a-z]+)-(?P<statistic>[a-z0-9]+)'
+    r'_(?P<project>[a-z0-9]+)_(?P=aggregation)'
+    r'_(?P<collection>[a-z0-9-]+)-(?P<scenario>(?:ssp|rcp)[0-9]+|historical)-(?P=product)'
+    r'_(?P<percentile>[a-z0-9]+)_(?P<period>[0-9]{4}-[0-9]{4})\.nc$'
+)
+
+
+def parse_filename(path):
+    """parse a CMIP file name into a record of its fields, plus its path and the name of its data variable. None if it doesn't match"""
+
+    match = filename_pattern.match(os.path.basename(path))
+    if match is None:
+        return None
+
+    record = match.groupdict()
+    record['path'] = path
+    record['var'] = '-'.join([record['product'], record['variable'], record['aggregation'], record['statistic']])
+    return record
+
+
+def catalog(data_dir='data'):
+    """records of every CMIP file in data_dir, skipping (with a warning) files whose names can't be parsed"""
+
+    records = []
+    for path in sorted(glob(f'{data_dir}/*.nc')):
+        record = parse_filename(path)
+        if record is None:
+            logging.warning(f'Skipping {path}: unrecognized CMIP file name')
+            continue
+        records.append(record)
+    return records
+
+
+def output_name(record):
+    """name of the output for a single file, from every field that tells files apart"""
+    return '-'.join([record['product'], record['variable'], record['aggregation'], record['statistic'], record['scenario'], record['percentile'], record['period']])
+
+
+def merged_name(record):
+    """name of the output that merges every scenario and percentile of a variable"""
+    return '-'.join([record['product'], record['variable'], record['aggregation'], record['statistic'], record['period']])
+
+
+def file_chunks(record, chunk_size=None):
+    """
+    split a CMIP file into chunks of chunk_size entries along the leading dimension of its data variable (e.g. year/time)
+    returns a list of (dim, start, stop), with a single chunk of the whole file if chunk_size is None
+    """
+
+    if chunk_size is None:
+        return [(None, None, None)]
+
+    with xr.open_dataset(record['path']) as ds:
+        da = ds[record['var']]
+        dim, size = da.dims[0], da.shape[0]
+
+    return [(dim, start, min(start + chunk_size, size)) for start in range(0, size, chunk_size)]
+
+
+def convert_file(record, chunk=(None, None, None)):
+    """
+    read the data variable of a CMIP file (or of one of its chunks, see file_chunks) as a flat dataframe
+    the dataset is opened lazily, so only the selected slice of the variable is loaded
+    """
+
+    dim, start, stop = chunk
+    with xr.open_dataset(record['path']) as ds:
+        if dim is not None:
+            ds = ds.isel({dim: slice(start, stop)})
+        return flatten_variable(ds, record['var'])
+
+
+def write_file(record, fmt='csv', compression=None, chunk_size=None):
+    """convert a single CMIP file to its own output, chunk by chunk. Returns the output path and number of rows"""
+
+    with FrameWriter(output_name(record), fmt, compression) as writer:
+        for chunk in file_chunks(record, chunk_size):
+            writer.write(convert_file(record, chunk))
+
+    return writer.path, writer.rows
+
 
+def merge_chunk(record, chunk=(None, None, None)):
+    """convert a chunk of a CMIP file to long-format rows tagged with its scenario and percentile"""
 
-def main():
-   
-    #DEBUG
-    # file = 'data/timeseries-tas-annual-mean_cmip6_annual_all-regridded-bct-ssp245-timeseries_median_2015-2100.nc'
-    
+    df = convert_file(record, chunk)
+    df.insert(0, 'percentile', record['percentile'])
+    df.insert(0, 'scenario', record['scenario'])
+    return df
 
-   
-    # pdb.set_trace()
-   
-   
-   
-    data_dir = 'data'
-    files = glob(f'{data_dir}/*.nc')  
-    for file in files:
-        #get filename from path
-        filename = os.path.basename(file)
-        fields = filename.split('_')
-        var = fields[0]
-        value = var.split('-')[1]
-        model = fields[3].split('-')[3]
 
-        #read the file
 
+def main(fmt='csv', compression=None, workers=1, merge=False, chunk_size=None):
+    """
+    convert every CMIP file in data/, across a process pool if workers > 1
 
-        ds = xr.open_dataset(file)
-        df = ds.to_dataframe()
-        df = df.reset_index()
-        del(df['nv'])
-        df = df.drop_duplicates()
-        out = f'{model}-{value}-annual-median.csv'
-        print(f'Writing {out}')
-        df[['year','lat','lon',var]].to_csv(f'{model}-{value}-annual-median.csv', index=False)
+    merge: write one long-format output per variable (and product/statistic/period), with scenario and percentile
+           columns, instead of one output per file
+    chunk_size: convert and write each file in chunks of this many entries of its leading dimension (e.g. years),
+                so memory use is bounded by the chunk size instead of the file size
+    """
 
+    records = catalog('data')
 
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
 
+    try:
+        if not merge:
+            args = (records, [fmt] * len(records), [compression] * len(records), [chunk_size] * len(records))
+            results = executor.map(write_file, *args) if executor is not None else map(write_file, *args)
+            for path, rows in results:
+                print(f'saved {path}: {rows} rows')
+            return
 
+        #chunks are converted in parallel and appended in catalog order to the output of their variable
+        tasks = [(record, chunk) for record in records for chunk in file_chunks(record, chunk_size)]
+        args = ([record for record, chunk in tasks], [chunk for record, chunk in tasks])
+        results = ordered_map(executor, merge_chunk, *args, ahead=2 * workers) if executor is not None else map(merge_chunk, *args)
 
+        writers = {}
+        for (record, chunk), df in zip(tasks, results):
+            name = merged_name(record)
+            if name not in writers:
+                writers[name] = FrameWriter(name, fmt, compression, categorical=['scenario', 'percentile'])
+            writers[name].write(df)
 
+        for writer in writers.values():
+            writer.close()
+            print(f'saved {writer.path}: {writer.rows} rows')
+    finally:
+        if executor is not None:
+            executor.shutdown()
 
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Convert CMIP6 NetCDF files for Dojo')
+    parser.add_argument('--workers', type=int, default=1, help='number of processes used to convert files (default: 1)')
+    parser.add_argument('--merge', action='store_true', help='merge all scenarios and percentiles of each variable into one long-format output')
+    parser.add_argument('--chunk-size', type=int, default=None, help='convert files in chunks of this many steps of their leading dimension (e.g. years), to bound memory use (default: whole file at once)')
+    add_output_arguments(parser)
+    args = parser.parse_args()
+    check_output_arguments(parser, args)
+
+    main(fmt=args.format, compression=args.compression, workers=args.workers, merge=args.merge, chunk_size=args.chunk_size)
@@ -1,5 +1,13 @@
 #script for automatically downloading CMIP data
 
+import os
+import sys
+import json
+import argparse
+from itertools import product
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from downloads import download_all
 
 
 variables = [
@@ -25,43 +33,63 @@ calculation = [
     # 'Anomaly (from reference period, 1995-20014)', #TODO: for later
 ]
 
+period = '2020-2039'
 
-#examples
-
-['Mean-Temperature', 'Median (50th)', 'SPP2-4.5', 'mean']
-'https://climatedata.worldbank.org/thredds/fileServer/CRM/cmip6/all-regridded-bct-ssp245-climatology/tas/median/annual/climatology-tas-annual-mean/2020-2039/climatology-tas-annual-mean_cmip6_annual_all-regridded-bct-ssp245-climatology_median_2020-2039.nc'
-
+base_url = 'https://climatedata.worldbank.org/thredds/fileServer/CRM/cmip6'
 
-['Mean-Temperature', 'Median (50th)', 'SPP5-8.5', 'mean']
-'https://climatedata.worldbank.org/thredds/fileServer/CRM/cmip6/all-regridded-bct-ssp585-climatology/tas/median/annual/climatology-tas-annual-mean/2020-2039/climatology-tas-annual-mean_cmip6_annual_all-regridded-bct-ssp585-climatology_median_2020-2039.nc'
 
+#example
+#['Mean-Temperature', 'Median (50th)', 'SPP2-4.5', 'mean']
+#'https://climatedata.worldbank.org/thredds/fileServer/CRM/cmip6/all-regridded-bct-ssp245-climatology/tas/median/annual/climatology-tas-annual-mean/2020-2039/climatology-tas-annual-mean_cmip6_annual_all-regridded-bct-ssp245-climatology_median_2020-2039.nc'
 
-['Mean-Temperature', '90th', 'SPP2-4.5', 'mean']
-'https://climatedata.worldbank.org/thredds/fileServer/CRM/cmip6/all-regridded-bct-ssp245-climatology/tas/p90/annual/climatology-tas-annual-mean/2020-2039/climatology-tas-annual-mean_cmip6_annual_all-regridded-bct-ssp245-climatology_p90_2020-2039.nc'
 
+def make_manifest(base_url=base_url, data_dir='data'):
+    """list the url and download path of every combination of variable, percentile, scenario and calculation"""
 
-['Min-Temperature', '10th', 'SPP2-4.5', 'mean']
-'https://climatedata.worldbank.org/thredds/fileServer/CRM/cmip6/all-regridded-bct-ssp245-climatology/tasmin/p10/annual/climatology-tasmin-annual-mean/2020-2039/climatology-tasmin-annual-mean_cmip6_annual_all-regridded-bct-ssp245-climatology_p10_2020-2039.nc'
+    manifest = []
+    for variable, p, scenario, calc in product(variables, percentile, scenarios, calculation):
+        filename = f'climatology-{variable}-annual-{calc}_cmip6_annual_all-regridded-bct-{scenario}-climatology_{p}_{period}.nc'
+        url = f'{base_url}/all-regridded-bct-{scenario}-climatology/{variable}/{p}/annual/climatology-{variable}-annual-{calc}/{period}/{filename}'
+        manifest.append({
+            'variable': variable,
+            'percentile': p,
+            'scenario': scenario,
+            'calculation': calc,
+            'url': url,
+            'path': os.path.join(data_dir, filename),
+        })
 
+    return manifest
 
-['Max-Temperature', '90th', 'SPP2-4.5', 'mean']
-'https://climatedata.worldbank.org/thredds/fileServer/CRM/cmip6/all-regridded-bct-ssp245-climatology/tasmax/p90/annual/climatology-tasmax-annual-mean/2020-2039/climatology-tasmax-annual-mean_cmip6_annual_all-regridded-bct-ssp245-climatology_p90_2020-2039.nc'
 
-['Precipitation', 'Median (50th)', 'SPP2-4.5', 'mean']
-'https://climatedata.worldbank.org/thredds/fileServer/CRM/cmip6/all-regridded-bct-ssp245-climatology/pr/median/annual/climatology-pr-annual-mean/2020-2039/climatology-pr-annual-mean_cmip6_annual_all-regridded-bct-ssp245-climatology_median_2020-2039.nc'
 
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Download the CMIP6 climatologies from the World Bank climate portal')
+    parser.add_argument('--workers', type=int, default=8, help='number of files downloaded at the same time (default: 8)')
+    parser.add_argument('--retries', type=int, default=5, help='number of times a failed download is retried (default: 5)')
+    parser.add_argument('--verify', action='store_true', help='recompute the checksum of files that were already downloaded before skipping them')
+    parser.add_argument('--base-url', default=base_url, help='server to download from, e.g. a mirror or local test server')
+    parser.add_argument('--data-dir', default='data', help='directory to download to (default: data)')
+    args = parser.parse_args()
 
-from subprocess import call
+    #save the list of files to fetch, alongside the downloads
+    manifest = make_manifest(args.base_url, args.data_dir)
+    if not os.path.exists(args.data_dir):
+        os.makedirs(args.data_dir)
+    with open(os.path.join(args.data_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=4)
 
+    print(f'getting {len(manifest)} files from {args.base_url}')
+    results = download_all([(entry['url'], entry['path']) for entry in manifest], workers=args.workers, retries=args.retries, verify=args.verify)
 
-#process for downloading all combinations of data with wget
-for variable in variables:
-    for p in percentile:
-        for scenario in scenarios:
-            for calc in calculation:
-                url = f'https://climatedata.worldbank.org/thredds/fileServer/CRM/cmip6/all-regridded-bct-{scenario}-climatology/{variable}/{p}/annual/climatology-{variable}-annual-mean/2020-2039/climatology-{variable}-annual-mean_cmip6_annual_all-regridded-bct-{scenario}-climatology_{p}_2020-2039.nc'
-                print(f'getting {[variable, p, scenario, calc]} from {url}')
-                
-                #download to data/ directory
-                call(['wget', '-P', 'data/', url])
+    failed = 0
+    for entry in manifest:
+        result = results[entry['path']]
+        if isinstance(result, Exception):
+            failed += 1
+            result = f'failed ({result})'
+        print(f'{[entry["variable"], entry["percentile"], entry["scenario"], entry["calculation"]]}: {result}')
 
+    if failed > 0:
+        print(f'{failed} of {len(manifest)} downloads failed, rerun to retry them')
+        sys.exit(1)
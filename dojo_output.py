@@ -0,0 +1,222 @@
+"""
+Shared output layer for the *_to_dojo scripts.
+
+Every converter writes its results through write_frame (or FrameWriter for chunked output),
+so the output format (csv, parquet or feather/arrow IPC) and compression are picked with a single option.
+"""
+
+import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+#supported output formats and their file extensions
+formats = {
+    'csv': '.csv',
+    'parquet': '.parquet',
+    'feather': '.feather',
+}
+
+#file extensions added by compressing csv output
+#(no zip: a zip archive can't be appended to, and csv output is written in chunks)
+csv_compression_extensions = {
+    'gzip': '.gz',
+    'bz2': '.bz2',
+    'xz': '.xz',
+    'zstd': '.zst',
+}
+
+#compression codecs supported by each output format
+compressions = {
+    'csv': list(csv_compression_extensions),
+    'parquet': ['snappy', 'gzip', 'brotli', 'lz4', 'zstd'],
+    'feather': ['lz4', 'zstd'],
+}
+
+
+def add_output_arguments(parser):
+    """add the --format and --compression options to an argparse parser"""
+
+    parser.add_argument('--format', choices=list(formats), default='csv', help='output file format (default: csv)')
+    parser.add_argument('--compression', default=None, choices=sorted({codec for codecs in compressions.values() for codec in codecs}), help='compression codec, e.g. gzip for csv, snappy/zstd for parquet, lz4/zstd for feather (default: the format\'s own default)')
+
+
+def check_output_arguments(parser, args):
+    """exit with a usage error if --compression isn't supported by the chosen --format, before any work is done"""
+
+    if args.compression is not None and args.compression not in compressions[args.format]:
+        parser.error(f'--compression {args.compression} is not supported for {args.format} output (choose from {", ".join(compressions[args.format])})')
+
+
+def output_path(path, fmt='csv', compression=None):
+    """add the extension for the given format (and csv compression) to path"""
+
+    if fmt not in formats:
+        raise ValueError(f'Invalid output format "{fmt}"')
+    if compression is not None and compression not in compressions[fmt]:
+        raise ValueError(f'Invalid compression "{compression}" for {fmt} output, expected one of {", ".join(compressions[fmt])}')
+
+    path = path + formats[fmt]
+    if fmt == 'csv' and compression is not None:
+        path = path + csv_compression_extensions[compression]
+
+    return path
+
+
+def is_output_file(filename):
+    """check if a filename has an extension produced by write_frame"""
+
+    exts = tuple(formats.values()) + tuple(formats['csv'] + ext for ext in csv_compression_extensions.values())
+    return filename.endswith(exts)
+
+
+def write_frame(df, path, fmt='csv', compression=None, categorical=None):
+    """
+    write a dataframe to path (without extension) in the given format
+
+    categorical: columns with many repeated strings (e.g. country, feature) to store as
+                 dictionary-encoded columns in parquet/feather output
+    returns the full path of the written file
+    """
+
+    with FrameWriter(path, fmt, compression, categorical) as writer:
+        writer.write(df)
+
+    return writer.path
+
+
+
+class FrameWriter:
+    """
+    Streaming writer that appends dataframes in chunks to a single output file,
+    so the full output never has to be held in memory.
+
+    usage:
+        with FrameWriter('output/name', 'parquet') as writer:
+            for chunk in chunks:
+                writer.write(chunk)
+    """
+
+    def __init__(self, path, fmt='csv', compression=None, categorical=None):
+        self.path = output_path(path, fmt, compression)
+        self.fmt = fmt
+        self.compression = compression
+        self.categorical = categorical or []
+        self.rows = 0
+
+        #values seen so far in each categorical column. Chunks are encoded against the growing
+        #dictionary, so later chunks only add dictionary deltas (required by the arrow IPC file format)
+        self.dictionaries = {col: pd.Index([], dtype=object) for col in self.categorical}
+
+        self.schema = None
+        self.writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, df):
+        """append a chunk of rows to the output file"""
+
+        if self.fmt == 'csv':
+            mode, header = ('w', True) if self.rows == 0 else ('a', False)
+            df.to_csv(self.path, index=False, mode=mode, header=header, compression=self.compression)
+            self.rows += len(df)
+            return
+
+        table = self._to_arrow(df)
+        if self.writer is None:
+            self.schema = table.schema
+            self.writer = self._open_arrow_writer()
+        elif not table.schema.equals(self.schema):
+            table = table.cast(self.schema)
+
+        self.writer.write_table(table)
+        self.rows += len(df)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    def _to_arrow(self, df):
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        for col in self.categorical:
+            i = table.schema.get_field_index(col)
+            table = table.set_column(i, col, self._encode(col, df[col]))
+        return table
+
+    def _encode(self, col, values):
+        """dictionary-encode a column against every value written so far in that column"""
+
+        values = values.astype(object)
+        known = self.dictionaries[col]
+        uniques = pd.Index(values.dropna().unique())
+        dictionary = known.append(uniques[~uniques.isin(known)])
+        self.dictionaries[col] = dictionary
+
+        codes = dictionary.get_indexer(values)
+        indices = pa.array(codes, type=pa.int32(), mask=codes < 0)
+        return pa.DictionaryArray.from_arrays(indices, pa.array(dictionary.to_numpy(), type=pa.string()))
+
+    def _open_arrow_writer(self):
+        if self.fmt == 'parquet':
+            return pq.ParquetWriter(self.path, self.schema, compression=self.compression or 'snappy')
+        if self.fmt == 'feather':
+            options = pa.ipc.IpcWriteOptions(compression=self.compression or 'lz4', emit_dictionary_deltas=True)
+            return pa.ipc.new_file(self.path, self.schema, options=options)
+        raise ValueError(f'Invalid output format "{self.fmt}"')
+
+
+
+class PartitionedWriter:
+    """
+    Streaming writer for a Hive-style partitioned dataset, e.g. root/continent=Africa/year=2030/data.parquet
+    Each chunk is split by the values of the partition columns and appended to the file of each partition,
+    so the full output never has to be held in memory. Partition columns are stored in the directory names
+    instead of the files, the way pyarrow/spark/duckdb expect to read them back.
+
+    usage:
+        with PartitionedWriter('output/by continent', ['continent'], 'parquet') as writer:
+            for chunk in chunks:
+                writer.write(chunk)
+    """
+
+    def __init__(self, root, partition_cols, fmt='csv', compression=None, categorical=None):
+        self.root = root
+        self.partition_cols = list(partition_cols)
+        self.fmt = fmt
+        self.compression = compression
+        self.categorical = [col for col in categorical or [] if col not in self.partition_cols]
+        self.writers = {} #map from the partition values of each file to its writer
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def rows(self):
+        return sum(writer.rows for writer in self.writers.values())
+
+    def write(self, df):
+        """append a chunk of rows to the files of the partitions it contains"""
+
+        for values, group in df.groupby(self.partition_cols, sort=False):
+            if values not in self.writers:
+                self.writers[values] = self._open_partition(values)
+            self.writers[values].write(group.drop(columns=self.partition_cols))
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
+
+    def _open_partition(self, values):
+        directory = os.path.join(self.root, *[f'{col}={value}' for col, value in zip(self.partition_cols, values)])
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        return FrameWriter(os.path.join(directory, 'data'), self.fmt, self.compression, self.categorical)
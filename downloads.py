@@ -0,0 +1,236 @@
+"""
+Shared downloader for the data processing scripts.
+
+Downloads are resumable (range requests on a .part file), conditional (ETag/Last-Modified
+are kept in a .json sidecar next to the file) and checksummed (sha256 recorded in the sidecar,
+optionally checked against an expected value). download_all fetches many files over a pool of threads,
+with pooled connections, retries and backoff.
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+def meta_path(path):
+    """path of the sidecar file that records what was downloaded to path"""
+    return path + '.json'
+
+
+def load_meta(path):
+    if not os.path.exists(meta_path(path)):
+        return {}
+    with open(meta_path(path), 'r') as f:
+        return json.load(f)
+
+
+def save_meta(path, meta):
+    with open(meta_path(path), 'w') as f:
+        json.dump(meta, f, indent=4)
+
+
+def file_sha256(path, chunk_size=1<<20):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(chunk_size):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def is_verified(path, full=False):
+    """
+    check if path is a complete download, i.e. it matches the size recorded in its sidecar
+    full: also recompute the sha256 of the file and compare it to the recorded one
+    """
+
+    meta = load_meta(path)
+    if not os.path.exists(path) or 'sha256' not in meta:
+        return False
+    if os.path.getsize(path) != meta['size']:
+        return False
+    if full and file_sha256(path) != meta['sha256']:
+        return False
+    return True
+
+
+def download(url, path, session=None, expected_sha256=None, chunk_size=1<<16, timeout=60):
+    """
+    download url to path
+
+    - if path was downloaded before, the request is conditional on the recorded ETag/Last-Modified,
+      and nothing is transferred when the server reports the file is unchanged
+    - data is streamed to path + '.part', and an interrupted download resumes from the end of it
+    - the sha256 of the file is recorded, and checked against expected_sha256 if given
+
+    returns True if a new copy of the file was downloaded, False if the existing file is up to date
+    """
+
+    session = session or requests.Session()
+    meta = load_meta(path)
+    part_path = path + '.part'
+    headers = {}
+
+    if is_verified(path):
+        if 'etag' in meta:
+            headers['If-None-Match'] = meta['etag']
+        if 'last_modified' in meta:
+            headers['If-Modified-Since'] = meta['last_modified']
+
+    #resume a partial download, as long as the file on the server is still the same version
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    if offset > 0:
+        headers['Range'] = f'bytes={offset}-'
+        if 'partial_etag' in meta:
+            headers['If-Range'] = meta['partial_etag']
+
+    with session.get(url, headers=headers, stream=True, timeout=timeout) as r:
+        if r.status_code == 304:
+            return False
+
+        if r.status_code == 416 and offset > 0:
+            #nothing to fetch past the end of the partial file. Either it is already complete (e.g. the process
+            #died before renaming it), or it is longer than the file on the server, and has to start over
+            if content_range_total(r) != offset:
+                os.remove(part_path)
+                return download(url, path, session, expected_sha256, chunk_size, timeout)
+            etag = meta.get('partial_etag')
+            last_modified = r.headers.get('Last-Modified')
+            total = offset
+            chunks = []
+        else:
+            r.raise_for_status()
+
+            #server sent the whole file (no range support, or the file changed), so start over
+            if r.status_code != 206:
+                offset = 0
+
+            etag = r.headers.get('ETag')
+            last_modified = r.headers.get('Last-Modified')
+            total = expected_size(r, offset)
+            chunks = r.iter_content(chunk_size)
+
+            #remember which version the partial file belongs to, so it can be resumed if interrupted
+            if etag is not None:
+                save_meta(path, {**meta, 'partial_etag': etag})
+
+        sha = hashlib.sha256()
+        if offset > 0:
+            with open(part_path, 'rb') as f:
+                while chunk := f.read(chunk_size):
+                    sha.update(chunk)
+
+        with open(part_path, 'ab' if offset > 0 else 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+                sha.update(chunk)
+
+    size = os.path.getsize(part_path)
+    if total is not None and size != total:
+        raise IOError(f'Incomplete download of {url}: got {size} of {total} bytes')
+
+    digest = sha.hexdigest()
+    if expected_sha256 is not None and digest != expected_sha256:
+        os.remove(part_path)
+        raise ValueError(f'Checksum mismatch for {url}: expected {expected_sha256}, got {digest}')
+
+    os.replace(part_path, path)
+    meta = {'url': url, 'size': size, 'sha256': digest}
+    if etag is not None:
+        meta['etag'] = etag
+    if last_modified is not None:
+        meta['last_modified'] = last_modified
+    save_meta(path, meta)
+
+    return True
+
+
+def content_range_total(response):
+    """total size of the file from the Content-Range header (bytes a-b/N, or bytes */N on a 416), if the server reported it"""
+
+    total = response.headers.get('Content-Range', '*').rsplit('/', 1)[-1].strip()
+    return int(total) if total.isdigit() else None
+
+
+def expected_size(response, offset):
+    """total size of the file being downloaded, if the server reported it"""
+
+    if response.status_code == 206 and 'Content-Range' in response.headers:
+        return content_range_total(response)
+    if 'Content-Length' in response.headers and 'Content-Encoding' not in response.headers:
+        return offset + int(response.headers['Content-Length'])
+    return None
+
+
+
+def is_retryable(error):
+    """check if a failed download is worth retrying (network errors, server errors, truncated transfers)"""
+
+    if isinstance(error, requests.HTTPError):
+        return error.response is not None and (error.response.status_code >= 500 or error.response.status_code == 429)
+    return isinstance(error, (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError, IOError))
+
+
+def download_with_retry(url, path, session=None, retries=5, backoff=1.0, **kwargs):
+    """
+    download (see download), retrying failed attempts with exponential backoff
+    each retry resumes from the partial file left by the previous attempt
+    """
+
+    for attempt in range(retries + 1):
+        try:
+            return download(url, path, session=session, **kwargs)
+        except Exception as e:
+            if attempt == retries or not is_retryable(e):
+                raise
+            time.sleep(backoff * 2 ** attempt)
+
+
+def make_session(pool_size=10):
+    """requests session that keeps up to pool_size connections per host open for reuse"""
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def download_all(jobs, workers=8, retries=5, backoff=1.0, verify=False):
+    """
+    download many files concurrently over a pool of threads, each with its own pooled session
+
+    jobs: list of (url, path) pairs, or (url, path, expected_sha256) triples
+    verify: recompute the sha256 of files that are already present, instead of only checking their size
+    files that are already present and verified are skipped without making a request
+    returns a dict from path to 'skipped', 'downloaded', 'unchanged', or the exception that made the download fail
+    """
+
+    local = threading.local()
+
+    def fetch(url, path, expected_sha256=None):
+        if is_verified(path, full=verify) and (expected_sha256 is None or load_meta(path)['sha256'] == expected_sha256):
+            return 'skipped'
+        if not hasattr(local, 'session'):
+            local.session = make_session()
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        updated = download_with_retry(url, path, session=local.session, retries=retries, backoff=backoff, expected_sha256=expected_sha256)
+        return 'downloaded' if updated else 'unchanged'
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(fetch, *job): job[1] for job in jobs}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                results[path] = future.result()
+            except Exception as e:
+                results[path] = e
+
+    return results
@@ -1,8 +1,15 @@
 import pandas as pd
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from dojo_output import add_output_arguments, check_output_arguments, write_frame
+
 import pdb
 
 
-def main():
+def main(fmt='csv', compression=None):
     data_path = 'idb5yr.all'
 
     # Read in the data with encoding latin-1
@@ -25,9 +32,14 @@ def main():
     df = df[to_keep]
 
 
-    #save the data to a csv file
-    df.to_csv('idb5yr.csv', index=False)
+    #save the data in the selected format
+    write_frame(df, 'idb5yr', fmt, compression, categorical=['NAME'])
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Convert the International Database population estimates for Dojo')
+    add_output_arguments(parser)
+    args = parser.parse_args()
+    check_output_arguments(parser, args)
+
+    main(fmt=args.format, compression=args.compression)
\ No newline at end of file
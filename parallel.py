@@ -0,0 +1,17 @@
+"""
+Shared helpers for running the data processing scripts across process pools.
+"""
+
+from collections import deque
+
+
+def ordered_map(executor, fn, *iterables, ahead=4):
+    """like executor.map, but with at most ahead results pending at a time, so unconsumed results don't pile up in memory"""
+
+    pending = deque()
+    for args in zip(*iterables):
+        pending.append(executor.submit(fn, *args))
+        if len(pending) >= ahead:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
@@ -1,25 +1,160 @@
 import xarray as xr
+import numpy as np
+import pandas as pd
+import argparse
+import logging
+import os
+import re
+import sys
+from glob import glob
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from dojo_output import add_output_arguments, check_output_arguments, write_frame, PartitionedWriter
+from parallel import ordered_map
+
 import pdb
 
-def main():
-    file = 'AR6_Projections/Regional/medium_confidence/ssp245/total_ssp245_medium_confidence_values.nc'
 
-    ds = xr.open_dataset(file)
-    df = ds.to_dataframe()
-    df = df.reset_index()
-    df = df.drop_duplicates()
+def value_columns(var, quantiles):
+    """names of the columns holding each requested quantile of var (just var if only one quantile is requested)"""
+
+    if len(quantiles) == 1:
+        return [var]
+    return [f'{var}_{q}' for q in quantiles]
+
+
+def flatten_quantiles(ds, quantiles, var='sea_level_change', locations=None):
+    """
+    flatten the requested quantiles of var into a dataframe with one row per (year, location) and one column per quantile
+    the quantiles are selected before anything is loaded, and per-location variables (lat, lon) are broadcast over the years
+
+    locations: optional dataframe of the per-location variables indexed by location id (see location_index),
+               used instead of reading them from ds. If ds has location ids that it doesn't cover, ds's own are read instead
+    """
+
+    if locations is not None and not np.isin(ds['locations'].to_numpy(), locations.index.to_numpy()).all():
+        locations = None
+
+    da = ds[var].sel(quantiles=list(quantiles)).transpose('quantiles', 'years', 'locations')
+    num_years, num_locations = da.sizes['years'], da.sizes['locations']
+
+    columns = {'years': np.repeat(ds['years'].to_numpy(), num_locations)}
+    for name in ds.data_vars:
+        if name == var:
+            values = da.to_numpy().reshape(len(quantiles), num_years * num_locations)
+            columns.update(zip(value_columns(var, quantiles), values))
+        elif ds[name].dims == ('locations',):
+            if locations is not None and name in locations.columns:
+                per_location = locations[name].reindex(ds['locations'].to_numpy()).to_numpy()
+            else:
+                per_location = ds[name].to_numpy()
+            columns[name] = np.tile(per_location, num_years)
+
+    return pd.DataFrame(columns)
+
+
+
+#AR6 regional projection files, e.g. AR6_Projections/Regional/medium_confidence/ssp245/total_ssp245_medium_confidence_values.nc
+filename_pattern = re.compile(r'^(?P<component>[A-Za-z]+)_(?P<scenario>ssp[0-9]+)_(?P<confidence>[a-z]+)_confidence_values\.nc$')
+
+
+def discover(root='AR6_Projections/Regional'):
+    """records (component, scenario, confidence, path) of every projection file in the {confidence}_confidence/{scenario}/ tree under root, skipping (with a warning) files whose names can't be parsed"""
+
+    records = []
+    for path in sorted(glob(os.path.join(root, '*_confidence', '*', '*_values.nc'))):
+        match = filename_pattern.match(os.path.basename(path))
+        if match is None:
+            logging.warning(f'Skipping {path}: unrecognized file name')
+            continue
+        records.append({**match.groupdict(), 'path': path})
+    return records
+
+
+def location_index(path):
+    """per-location variables (lat, lon) of a projection file, indexed by location id, to share across files"""
 
-    #keep only the median quantile
-    df = df[df['quantiles'] == 0.5]
+    with xr.open_dataset(path) as ds:
+        names = [name for name in ds.data_vars if ds[name].dims == ('locations',)]
+        return ds[names].to_dataframe()
 
-    #drop the quantiles, and locations column
-    del(df['quantiles'])
-    del(df['locations'])
 
-    #save to csv
-    df.to_csv('ssp245.csv', index=False)
+#state for worker processes, set once per process by _init_worker
+_worker = {}
+
+def _init_worker(locations, quantiles):
+    _worker['locations'] = locations
+    _worker['quantiles'] = quantiles
+
+
+def convert_record(record):
+    """convert a projection file, tagged with its scenario, confidence and component"""
+
+    with xr.open_dataset(record['path']) as ds:
+        df = flatten_quantiles(ds, _worker['quantiles'], locations=_worker['locations'])
+
+    df.insert(0, 'component', record['component'])
+    df.insert(0, 'confidence', record['confidence'])
+    df.insert(0, 'scenario', record['scenario'])
+    return df
+
+
+def convert_all(fmt='csv', compression=None, quantiles=(0.5,), workers=1, root='AR6_Projections/Regional'):
+    """
+    convert every projection file under root into one dataset partitioned by scenario and confidence, with a component column
+    the location coordinates are read once and shared by all files, which are converted across a process pool if workers > 1
+    """
+
+    records = discover(root)
+    if len(records) == 0:
+        print(f'No projection files found under {root}')
+        return
+    locations = location_index(records[0]['path'])
+
+    if workers > 1:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(locations, quantiles))
+        frames = ordered_map(executor, convert_record, records, ahead=2 * workers)
+    else:
+        executor = None
+        _init_worker(locations, quantiles)
+        frames = map(convert_record, records)
+
+    try:
+        with PartitionedWriter('AR6_regional', ['scenario', 'confidence'], fmt, compression, categorical=['component']) as writer:
+            for frame in frames:
+                writer.write(frame)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    for file in writer.writers.values():
+        print(f'saved {file.path}: {file.rows} rows')
+
+
+
+def main(fmt='csv', compression=None, quantiles=(0.5,)):
+    file = 'AR6_Projections/Regional/medium_confidence/ssp245/total_ssp245_medium_confidence_values.nc'
+
+    #keep only the requested quantiles (the median by default), one column each
+    with xr.open_dataset(file) as ds:
+        df = flatten_quantiles(ds, quantiles)
+
+    #save in the selected format
+    write_frame(df, 'ssp245', fmt, compression)
 
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Convert AR6 sea level projections for Dojo')
+    parser.add_argument('--quantiles', type=float, nargs='+', default=[0.5], help='quantiles to extract, each as its own column (default: 0.5)')
+    parser.add_argument('--batch', action='store_true', help='convert every scenario, confidence level and component under AR6_Projections/Regional into one partitioned dataset')
+    parser.add_argument('--workers', type=int, default=1, help='number of processes used to convert files in batch mode (default: 1)')
+    add_output_arguments(parser)
+    args = parser.parse_args()
+    check_output_arguments(parser, args)
+
+    if args.batch:
+        convert_all(fmt=args.format, compression=args.compression, quantiles=args.quantiles, workers=args.workers)
+    else:
+        main(fmt=args.format, compression=args.compression, quantiles=args.quantiles)
@@ -0,0 +1,112 @@
+import os
+import sys
+import hashlib
+import threading
+import http.server
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from downloads import download, download_all, load_meta
+
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    """local stand-in for a download server, with ETag and Range support (416 for ranges past the end of the file)"""
+
+    files = {}
+    requests = []
+
+    def do_GET(self):
+        data = self.files[self.path]
+        etag = '"%s"' % hashlib.md5(data).hexdigest()
+        self.requests.append(dict(self.headers))
+
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        body = data
+        byte_range = self.headers.get('Range')
+        if byte_range is not None and self.headers.get('If-Range') in (None, etag):
+            start = int(byte_range.split('=')[1].split('-')[0])
+            if start >= len(data):
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{len(data)}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{len(data) - 1}/{len(data)}')
+            body = data[start:]
+        else:
+            self.send_response(200)
+
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    StubHandler.files = {'/data.bin': os.urandom(100000)}
+    StubHandler.requests = []
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{httpd.server_address[1]}'
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_download_and_skip_unchanged(server, tmp_path):
+    path = str(tmp_path / 'data.bin')
+    data = StubHandler.files['/data.bin']
+
+    assert download(server + '/data.bin', path)
+    assert open(path, 'rb').read() == data
+    assert load_meta(path)['sha256'] == hashlib.sha256(data).hexdigest()
+
+    assert not download(server + '/data.bin', path)
+
+
+def test_resume_partial_download(server, tmp_path):
+    path = str(tmp_path / 'data.bin')
+    data = StubHandler.files['/data.bin']
+    with open(path + '.part', 'wb') as f:
+        f.write(data[:40000])
+
+    assert download(server + '/data.bin', path)
+    assert open(path, 'rb').read() == data
+    assert StubHandler.requests[-1]['Range'] == 'bytes=40000-'
+
+
+def test_complete_partial_download_is_finished(server, tmp_path):
+    #e.g. the process died between the last write and renaming the .part file
+    path = str(tmp_path / 'data.bin')
+    data = StubHandler.files['/data.bin']
+    with open(path + '.part', 'wb') as f:
+        f.write(data)
+
+    assert download(server + '/data.bin', path)
+    assert open(path, 'rb').read() == data
+    assert not os.path.exists(path + '.part')
+    assert load_meta(path)['sha256'] == hashlib.sha256(data).hexdigest()
+    assert len(StubHandler.requests) == 1
+
+
+def test_too_long_partial_download_starts_over(server, tmp_path):
+    #e.g. the file shrank upstream, and there was no ETag to send as If-Range
+    path = str(tmp_path / 'data.bin')
+    data = StubHandler.files['/data.bin']
+    with open(path + '.part', 'wb') as f:
+        f.write(os.urandom(150000))
+
+    results = download_all([(server + '/data.bin', path)], workers=1, retries=0)
+    assert results[path] == 'downloaded'
+    assert open(path, 'rb').read() == data
+    assert 'Range' not in StubHandler.requests[-1]
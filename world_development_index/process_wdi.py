@@ -1,82 +1,365 @@
 import pandas as pd
+import numpy as np
 import json
-from subprocess import call
 import os
 from glob import glob
 from zipfile import ZipFile
 from tqdm import tqdm
 from datetime import datetime, timezone
-from uuid import uuid4
+from uuid import uuid5, NAMESPACE_URL
+from tempfile import TemporaryDirectory
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pyarrow.feather as feather
+import requests
+import argparse
+import hashlib
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from dojo_output import add_output_arguments, check_output_arguments, FrameWriter, is_output_file
+from downloads import download_with_retry
 
 import pdb
 
-def main():
-    download_data()
 
-    raw_data = pd.read_csv('data/WDIData.csv')
+data_link = 'http://databank.worldbank.org/data/download/WDI_csv.zip'
+
+zip_path = os.path.join('data', 'WDI_csv.zip')
+
+#namespace for dataset ids, so each group always gets the same id
+dataset_namespace = uuid5(NAMESPACE_URL, data_link)
+
+#year columns in WDIData.csv, and their timestamps (in milliseconds) from 1960 to 2021
+years = [f'{year}' for year in range(1960, 2022)]
+timestamps = np.array([datetime(int(year), 1, 1, tzinfo=timezone.utc).timestamp()*1000 for year in years], dtype=np.int64)
+
+
+def main(workers=1, fmt='csv', compression=None, chunk_rows=None, rebuild=False, regroup=False, extract=True):
+    download_data(extract=extract)
+
+    raw_data = read_cached_csv('data/WDIData.csv', source_path=zip_path, from_zip=not extract)
 
     #list of valid country codes
-    countries = pd.read_csv('country.csv')
+    countries = read_cached_csv('country.csv')
     country_codes = set(countries['Alpha-3_Code'].tolist())
-    series_info = pd.read_csv('data/WDISeries.csv')
+    series_info = read_cached_csv('data/WDISeries.csv', source_path=zip_path, from_zip=not extract)
 
     #DEBUG. user should define what the groups are in indicator_groups.json
-    save_indicators(raw_data, series_info)
+    #only regenerated on request, so that edits to the groups are kept
+    if regroup or not os.path.exists('indicator_groups.json'):
+        save_indicators(raw_data, series_info)
+
+    #precompute the metadata info for every series once, rather than per group
+    series_index = index_series_info(series_info)
+
+    #ensure output folder exists
+    if not os.path.exists('output'):
+        os.makedirs('output')
+
+    #without a manifest there is no record of what is in the output folder, so start from scratch
+    manifest = {} if rebuild else load_manifest()
+    if len(manifest) == 0:
+        #delete all data and json files in output folder
+        for filename in glob('output/*'):
+            if is_output_file(filename) or filename.endswith('.json'):
+                os.remove(filename)
+
+    groups = list(indicator_groups())
+    options = {'fmt': fmt, 'compression': compression, 'chunk_rows': chunk_rows}
+
+    #hash the inputs of every group, and only rebuild the groups whose inputs or output settings changed
+    output = [fmt, compression]
+    hashes = {
+        name: hash_group(name, indicators, df_subset, country_codes, series_index)
+        for name, indicators, df_subset in partition_groups(raw_data, groups)
+    }
+    changed = [(name, indicators) for name, indicators in groups if not is_up_to_date(manifest.get(name), hashes[name], output)]
+    print(f'{len(changed)} of {len(groups)} datasets need to be rebuilt')
+
+    #datasets whose content is unchanged (e.g. only the output format changed) keep their creation time
+    now = datetime.now(timezone.utc).timestamp()*1000
+    created_at = {name: now for name, _ in changed}
+    for name, _ in changed:
+        if name in manifest and manifest[name]['hash'] == hashes[name]:
+            created_at[name] = manifest[name].get('created_at', now)
+
+    #remove outputs of groups that are being rebuilt or no longer exist
+    for name in list(manifest):
+        if name not in hashes or not is_up_to_date(manifest[name], hashes[name], output):
+            for filename in manifest.pop(name)['outputs']:
+                if os.path.exists(filename):
+                    os.remove(filename)
+    save_manifest(manifest)
+
+    #nothing to rebuild means no need to share the raw data or start a pool
+    if workers > 1 and len(changed) > 0:
+        emitted = emit_parallel(raw_data, changed, country_codes, series_index, created_at, workers, options)
+    else:
+        emitted = (
+            (name, emit_group(name, indicators, df_subset, country_codes, series_index, created_at[name], **options))
+            for name, indicators, df_subset in partition_groups(raw_data, changed)
+        )
 
-    #delete all CSVs and json files in output folder
-    for filename in glob('output/*.csv') + glob('output/*.json'):
-        os.remove(filename)
+    for name, outputs in tqdm(emitted, total=len(changed), desc='Making datasets'):
+        manifest[name] = {
+            'hash': hashes[name],
+            'output': output,
+            'id': dataset_id(name),
+            'created_at': created_at[name],
+            'outputs': outputs,
+        }
+        save_manifest(manifest)
 
 
-    for name, indicators in tqdm(indicator_groups(), total=sum(1 for _ in indicator_groups()), desc='Making datasets'):
 
-        #TODO: come up with better description from somewhere...
-        description = f'World Bank Development Indicators: {", ".join(indicators)}'
+def group_description(indicators):
+    #TODO: come up with better description from somewhere...
+    return f'World Bank Development Indicators: {", ".join(indicators)}'
 
-        #collect all rows in df that have an indicator in indicators
-        df_subset = raw_data[raw_data['Indicator Code'].isin(set(indicators))]
 
-        #make dataset 
-        df = make_dataset(df_subset, country_codes)
+def emit_group(name, indicators, df_subset, country_codes, series_index, created_at, fmt='csv', compression=None, chunk_rows=None):
+    """
+    make the dataset + metadata for a single group of indicators, and save them to the output folder
+    returns the paths of the written files
 
-        #create metadata for dataset
-        meta = make_metadata(df, series_info, name, description)#, feature_codes)
+    chunk_rows: if given, make and write the dataset in chunks of about this many output rows,
+                so memory use is bounded by the chunk size instead of the size of the group
+    """
 
-        #ensure output folder exists
-        if not os.path.exists('output'):
-            os.makedirs('output')
-        
-        #save data to csv and metadata to json
-        df.to_csv(os.path.join('output', f'{name}.csv'), index=False)
-        with open(os.path.join('output', f'{name} - meta.json'), 'w') as f:
-            json.dump(meta, f)
+    description = group_description(indicators)
+
+    #make dataset 
+    if chunk_rows is None:
+        chunks = [make_dataset(df_subset, country_codes)]
+    else:
+        chunks = iter_dataset(df_subset, country_codes, chunk_rows)
 
+    #save data in the selected format, collecting what the metadata needs along the way
+    summary = None
+    with FrameWriter(os.path.join('output', name), fmt, compression, categorical=['country', 'feature']) as writer:
+        for df in chunks:
+            writer.write(df)
+            summary = summarize_dataset(df, summary)
 
+    #create metadata for dataset and save to json
+    meta = make_metadata(summary, series_index, name, description, created_at)#, feature_codes)
+    meta_path = os.path.join('output', f'{name} - meta.json')
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f)
 
+    return [writer.path, meta_path]
 
-def download_data():
-    """download data and unzip if not already done"""
-    
-    data_link = 'http://databank.worldbank.org/data/download/WDI_csv.zip'
 
-    # download to 'data' folder if not already downloaded
+
+def emit_parallel(raw_data, groups, country_codes, series_index, created_at, workers, options):
+    """
+    emit every group of indicators using a pool of worker processes
+    yields (name, outputs) for each group as it finishes
+
+    the raw data is written once to memory-mapped .npy files that every worker opens,
+    so only each group's row positions are sent to the workers
+    """
+
+    with TemporaryDirectory() as shared_dir:
+        share_raw_data(raw_data, shared_dir)
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(shared_dir, country_codes, series_index, options)) as executor:
+            futures = {executor.submit(_emit_shared_group, name, indicators, rows, created_at[name]): name for name, indicators, rows in group_positions(raw_data, groups)}
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+
+
+
+manifest_path = os.path.join('output', 'manifest.json')
+
+def load_manifest():
+    """
+    load the record of previously built datasets
+    maps from the name of each group to the hash of its inputs, its output settings, id,
+    creation time and the files it produced
+    """
+
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, 'r') as f:
+        return json.load(f)
+
+
+def save_manifest(manifest):
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, indent=4)
+
+
+def is_up_to_date(entry, hash, output):
+    """check if a manifest entry was built from inputs with the given hash and output settings, and its files still exist"""
+
+    if entry is None or entry['hash'] != hash or entry.get('output') != output:
+        return False
+    return all(os.path.exists(filename) for filename in entry['outputs'])
+
+
+def hash_group(name, indicators, df_subset, country_codes, series_index):
+    """
+    hash everything that goes into the content of a group's output files:
+    its slice of the raw data, its indicators and the metadata inputs
+    """
+
+    h = hashlib.sha256()
+    h.update(pd.util.hash_pandas_object(df_subset[shared_columns + years], index=False).to_numpy().tobytes())
+    h.update(json.dumps({
+        'name': name,
+        'indicators': indicators,
+        'description': group_description(indicators),
+        'series': {indicator: series_index.get(indicator) for indicator in indicators},
+        'country_codes': sorted(country_codes),
+    }, sort_keys=True).encode())
+
+    return h.hexdigest()
+
+
+
+#columns of the raw data that are shared with worker processes, besides the year columns
+shared_columns = ['Country Name', 'Country Code', 'Indicator Code']
+
+def share_raw_data(df, path):
+    """save the columns of df needed by make_dataset as .npy files that can be memory-mapped"""
+
+    np.save(os.path.join(path, 'values.npy'), df[years].to_numpy(dtype=np.float64))
+    for col in shared_columns:
+        np.save(os.path.join(path, f'{col}.npy'), df[col].to_numpy(dtype=str))
+
+
+def load_shared_raw_data(path):
+    """memory-map the arrays saved by share_raw_data"""
+
+    shared = {col: np.load(os.path.join(path, f'{col}.npy'), mmap_mode='r') for col in shared_columns}
+    shared['values'] = np.load(os.path.join(path, 'values.npy'), mmap_mode='r')
+    return shared
+
+
+#state for worker processes, set once per process by _init_worker
+_worker = {}
+
+def _init_worker(shared_dir, country_codes, series_index, options):
+    _worker['shared'] = load_shared_raw_data(shared_dir)
+    _worker['country_codes'] = country_codes
+    _worker['series_index'] = series_index
+    _worker['options'] = options
+
+
+def _emit_shared_group(name, indicators, rows, created_at):
+    shared = _worker['shared']
+    df_subset = pd.DataFrame(shared['values'][rows], columns=years)
+    for i, col in enumerate(shared_columns):
+        df_subset.insert(i, col, shared[col][rows].astype(object))
+
+    return emit_group(name, indicators, df_subset, _worker['country_codes'], _worker['series_index'], created_at, **_worker['options'])
+
+
+
+
+cache_dir = os.path.join('data', 'cache')
+
+#members of the zip that are read into the cache, and don't need to be extracted
+cached_members = ['WDIData.csv', 'WDISeries.csv']
+
+def read_cached_csv(csv_path, source_path=None, from_zip=False):
+    """
+    read a csv file through a typed, uncompressed feather copy of it in data/cache
+    repeated strings are stored as categoricals, and later runs memory-map the cache instead of parsing the csv
+
+    source_path: file the csv came from (e.g. the downloaded zip). The cache is rebuilt whenever
+                 its size or modification time changes. Defaults to the csv itself
+    from_zip: stream the csv straight out of the source_path zip, instead of reading the extracted file
+    """
+
+    source_path = source_path or csv_path
+    stat = os.stat(source_path)
+    key = {'source': source_path, 'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+
+    name = os.path.splitext(os.path.basename(csv_path))[0]
+    cache_path = os.path.join(cache_dir, f'{name}.feather')
+    key_path = os.path.join(cache_dir, f'{name}.json')
+
+    if os.path.exists(cache_path) and os.path.exists(key_path):
+        with open(key_path, 'r') as f:
+            if json.load(f) == key:
+                return feather.read_table(cache_path, memory_map=True).to_pandas()
+
+    print(f'Caching {csv_path}...', end='', flush=True)
+    dtype = {year: np.float64 for year in years}
+    if from_zip:
+        with ZipFile(source_path, 'r') as zip_ref, zip_ref.open(os.path.basename(csv_path)) as f:
+            df = pd.read_csv(f, dtype=dtype)
+    else:
+        df = pd.read_csv(csv_path, dtype=dtype)
+
+    #codes and names repeat across many rows, so store them as categoricals
+    for col in df.columns:
+        if df[col].dtype == object and df[col].nunique() < len(df) // 2:
+            df[col] = df[col].astype('category')
+
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+    df.to_feather(cache_path, compression='uncompressed')
+    with open(key_path, 'w') as f:
+        json.dump(key, f)
+    print('Done')
+
+    return df
+
+
+
+def download_data(extract=True):
+    """
+    download the data if it changed upstream, and extract any zip members that are missing or stale
+
+    extract: if False, skip extracting WDIData.csv and WDISeries.csv, which are read straight from the zip into the cache
+    """
+
+    # download to 'data' folder, unless the copy there is already up to date
     if not os.path.exists('data'):
         os.makedirs('data')
-    if not os.path.exists('data/WDI_csv.zip'):
-        call(['wget', data_link, '-O', 'data/WDI_csv.zip'])
-    else:
-        print('Skipping download, data already exists')
-
-    #unzip data if not already unzipped
-    with ZipFile('data/WDI_csv.zip', 'r') as zip_ref:
-        filenames = zip_ref.namelist()
-        if not all([os.path.exists('data/' + filename) for filename in filenames]):
-            print('Unzipping data...', end='', flush=True)
-            zip_ref.extractall('data')
-            print('Done')
+    try:
+        if download_with_retry(data_link, zip_path, retries=2):
+            print('Downloaded new data')
         else:
+            print('Skipping download, data is up to date')
+    except (requests.RequestException, IOError):
+        #network errors, timeouts, server errors or a truncated transfer: fall back to the existing download if there is one
+        if not os.path.exists(zip_path):
+            raise
+        print('Could not check for new data, using existing download')
+
+    #unzip members that have not been extracted from this version of the zip
+    members_path = os.path.join('data', 'extracted.json')
+    extracted = {}
+    if os.path.exists(members_path):
+        with open(members_path, 'r') as f:
+            extracted = json.load(f)
+
+    with ZipFile(zip_path, 'r') as zip_ref:
+        stale = []
+        for info in zip_ref.infolist():
+            if not extract and info.filename in cached_members:
+                continue
+            path = os.path.join('data', info.filename)
+            if not os.path.exists(path) or os.path.getsize(path) != info.file_size or extracted.get(info.filename) != info.CRC:
+                stale.append(info)
+
+        if len(stale) == 0:
             print('Skipping unzip, data already exists')
-        
+            return
+
+        print(f'Unzipping {", ".join(info.filename for info in stale)}...', end='', flush=True)
+        for info in stale:
+            zip_ref.extract(info, 'data')
+            extracted[info.filename] = info.CRC
+        with open(members_path, 'w') as f:
+            json.dump(extracted, f)
+        print('Done')
+
+
 
 def save_indicators(df, series_info):
     """For debugging purposes, create mock version of indicator_groups.json"""
@@ -144,85 +427,177 @@ def indicator_groups():
 
 
 
+def group_positions(df, groups):
+    """
+    find the rows of df that belong to each group of indicators, with a single pass over the indicator codes
+
+    yields (name, indicators, rows) for each (name, indicators) in groups
+    rows are sorted positions in df, so each group keeps the original row order
+    """
+
+    #map from each indicator code to the positions of its rows in df
+    positions = df.groupby('Indicator Code', sort=False, observed=True).indices
+    empty = np.array([], dtype=np.intp)
+
+    for name, indicators in groups:
+        #hand-edited groups may list an indicator more than once, but its rows belong to the group only once
+        rows = [positions.get(indicator, empty) for indicator in dict.fromkeys(indicators)]
+        rows = np.sort(np.concatenate(rows)) if len(rows) > 0 else empty
+        yield name, indicators, rows
+
+
+def partition_groups(df, groups):
+    """split df into a slice per group of indicators. yields (name, indicators, slice) for each (name, indicators) in groups"""
+    for name, indicators, rows in group_positions(df, groups):
+        yield name, indicators, df.take(rows)
+
+
+
+
+def iter_dataset(df, country_codes, chunk_rows):
+    """
+    generator version of make_dataset that yields the long format rows in chunks
+    each chunk has at most chunk_rows rows (but always at least one input row's worth of years)
+    """
+
+    df = df[df['Country Code'].isin(country_codes)]
+    step = max(1, chunk_rows // len(years))
+    for start in range(0, max(len(df), 1), step): #always yield at least one (possibly empty) chunk
+        yield make_dataset(df.iloc[start:start+step], country_codes)
+
+
+
 def make_dataset(df, country_codes):
+    """convert wide WDI rows (one column per year) into long format Dojo rows"""
 
     # columns = ['timestamp', 'country', 'admin1', 'admin2', 'admin3', 'lat', 'lng', 'feature', 'value']
 
-    #year strings and timestamps (in milliseconds) from 1960 to 2021
-    years = [(f'{year}', datetime(year, 1, 1, tzinfo=timezone.utc).timestamp()*1000) for year in range(1960, 2022)]
+    #filter out rows that are not countries
+    df = df[df['Country Code'].isin(country_codes)]
+
+    #stack the year columns row by row, so output stays grouped by indicator/country like the input
+    num_rows = len(df)
+    num_years = len(years)
+    values = df[years].to_numpy(dtype=np.float64).ravel()
+
+    df = pd.DataFrame({
+        'timestamp': np.tile(timestamps, num_rows),
+        'country': np.repeat(df['Country Name'].to_numpy(), num_years),
+        'admin1': None,
+        'admin2': None,
+        'admin3': None,
+        'lat': None,
+        'lng': None,
+        'feature': np.repeat(df['Indicator Code'].to_numpy(), num_years), #Indicator Name will go in the description
+        'value': values,
+    })
+
+    return df
+
 
-    rows = []
-    # feature_codes = set(df['Indicator Code'].tolist())
 
-    for _, row in tqdm(df.iterrows(), total=len(df), desc='Making rows', leave=False):
-        #filter out rows that are not countries
-        if row['Country Code'] not in country_codes:
+def index_series_info(series_info):
+    """
+    build a map from each Series Code to the info used in its metadata output
+    (display name, description, unit), so make_metadata only needs a dict lookup per feature
+    """
+
+    index = {}
+    for info in series_info.to_dict('records'):
+        code = info['Series Code']
+        if code in index: #keep the first row for each code
             continue
-        for year, timestamp in years:
-            rows.append({
-                'timestamp': timestamp,
-                'country': row['Country Name'],
-                'admin1': None,
-                'admin2': None,
-                'admin3': None,
-                'lat': None,
-                'lng': None,
-                'feature': row['Indicator Code'], #Indicator Name will go in the description
-                'value': row[year]
-            })
-
-    df = pd.DataFrame(rows)
+        index[code] = {
+            'display_name': info['Indicator Name'],
+            'description': get_description(info),
+            'unit': get_unit(info),
+            'unit_description': get_unit_description(info),
+        }
+
+    return index
+
+
+def get_description(info: dict) -> str:
+    ret = info.get('Long definition', None)
+    if pd.isnull(ret):
+        ret = info.get('Short definition', None)
+    if pd.isnull(ret):
+        ret = info.get('Indicator Name')
+    if pd.isnull(ret):
+        ret = ''
+    return ret
+
+def get_unit(info) -> str:
+    unit = None
+    try:
+        #sometimes units are at the end of the indicator name (e.g. 'GDP (current US$)')
+        name:str = info['Indicator Name']
+        if name.endswith(')'):
+            unit = name[name.rfind('(')+1:-1]
+    except:
+        unit = None
+    if unit is None:
+        unit = info.get('Unit of measure', None)
+    if pd.isnull(unit):
+        unit = 'NA'
+    return unit
+    
+def get_unit_description(info) -> str:
+    return get_unit(info) #no other source of info for this
 
 
-    return df
+
+def summarize_dataset(df, summary=None):
+    """
+    collect the parts of a dataset that make_metadata needs (features, countries, timestamp range)
+    pass the previous summary to update it with another chunk of the same dataset
+    """
+
+    if summary is None:
+        summary = {'features': {}, 'countries': {}, 'min_timestamp': None, 'max_timestamp': None}
+    if len(df) == 0:
+        return summary
+
+    #dicts keep the order each feature/country first appears in
+    summary['features'].update(dict.fromkeys(df['feature'].unique().tolist()))
+    summary['countries'].update(dict.fromkeys(df['country'].unique().tolist()))
+
+    min_timestamp = int(df['timestamp'].min())
+    max_timestamp = int(df['timestamp'].max())
+    if summary['min_timestamp'] is None or min_timestamp < summary['min_timestamp']:
+        summary['min_timestamp'] = min_timestamp
+    if summary['max_timestamp'] is None or max_timestamp > summary['max_timestamp']:
+        summary['max_timestamp'] = max_timestamp
+
+    return summary
+
 
 
+def dataset_id(name):
+    """deterministic id for the dataset made from a group, so it stays the same between runs"""
+    return str(uuid5(dataset_namespace, name))
 
-def make_metadata(df, series_info, name, description):
+
+def make_metadata(summary, series_index, name, description, created_at=None):
     #get the min and max timestamps
-    min_timestamp = df['timestamp'].min()
-    max_timestamp = df['timestamp'].max()
-    id = str(uuid4())
-
-    features = df['feature'].unique().tolist()
-    countries = df['country'].unique().tolist()
-
-    #create a map from the feature name to the row in series_info['Indicator Name'] == feature name
-    feature_map = {feature: dict(series_info[series_info['Series Code'] == feature].iloc[0]) for feature in features}
-    def get_description(info: dict) -> str:
-        ret = info.get('Long definition', None)
-        if pd.isnull(ret):
-            ret = info.get('Short definition', None)
-        if pd.isnull(ret):
-            ret = info.get('Indicator Name')
-        if pd.isnull(ret):
-            ret = ''
-        return ret
-    
-    def get_unit(info) -> str:
-        unit = None
-        try:
-            #sometimes units are at the end of the indicator name (e.g. 'GDP (current US$)')
-            name:str = info['Indicator Name']
-            if name.endswith(')'):
-                unit = name[name.rfind('(')+1:-1]
-        except:
-            unit = None
-        if unit is None:
-            unit = info.get('Unit of measure', None)
-        if pd.isnull(unit):
-            unit = 'NA'
-        return unit
-        
-    def get_unit_description(info) -> str:
-        return get_unit(info) #no other source of info for this
+    min_timestamp = summary['min_timestamp']
+    max_timestamp = summary['max_timestamp']
+    id = dataset_id(name)
+    if created_at is None:
+        created_at = datetime.now(timezone.utc).timestamp()*1000
+
+    features = list(summary['features'])
+    countries = list(summary['countries'])
+
+    #look up the precomputed series info for each feature
+    feature_map = {feature: series_index[feature] for feature in features}
 
     meta = {
         "id": id,
         "name": name,
         "family_name": None,
         "description": description,
-        "created_at": datetime.now(timezone.utc).timestamp()*1000,
+        "created_at": created_at,
         "category": None,
         "domains": ["Economic Sciences"],
         "maintainer": {
@@ -235,11 +610,11 @@ def make_metadata(df, series_info, name, description):
         "outputs": [
             {
                 "name": feature,
-                "display_name": info['Indicator Name'],
-                "description": get_description(info),
+                "display_name": info['display_name'],
+                "description": info['description'],
                 "type": "float", #TODO: maybe check the datatype in df?
-                "unit": get_unit(info),
-                "unit_description": get_unit_description(info),
+                "unit": info['unit'],
+                "unit_description": info['unit_description'],
                 "ontologies": {
                     "concepts": [],
                     "processes": [],
@@ -557,4 +932,22 @@ def find_abbreviations(all_codes, info):
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Convert the World Development Indicators into Dojo datasets')
+    parser.add_argument('--workers', type=int, default=1, help='number of processes used to make datasets (default: 1)')
+    parser.add_argument('--chunk-rows', type=int, default=None, help='make and write each dataset in chunks of about this many rows, to bound memory use (default: whole dataset at once)')
+    parser.add_argument('--rebuild', action='store_true', help='rebuild every dataset, even if its inputs have not changed')
+    parser.add_argument('--regroup', action='store_true', help='regenerate indicator_groups.json from the data (overwrites any edits)')
+    parser.add_argument('--no-extract', dest='extract', action='store_false', help='read the data csvs straight from the zip into the cache, without extracting them')
+    add_output_arguments(parser)
+    args = parser.parse_args()
+    check_output_arguments(parser, args)
+
+    main(
+        workers=args.workers,
+        fmt=args.format,
+        compression=args.compression,
+        chunk_rows=args.chunk_rows,
+        rebuild=args.rebuild,
+        regroup=args.regroup,
+        extract=args.extract,
+    )
\ No newline at end of file